@@ -1,6 +1,6 @@
-import React, { useState, useEffect, useMemo } from "react";
+import React, { useState, useEffect, useMemo, useRef } from "react";
 import { createRoot } from "react-dom/client";
-import { GoogleGenAI } from "@google/genai";
+import type { GoogleGenAI } from "@google/genai";
 import {
   LineChart,
   Line,
@@ -32,6 +32,15 @@ interface ExperimentRecord {
   notes: string;
 }
 
+// 附帶預先算好衍生值的紀錄：Δm 只在 records 變動時算一次，
+// 排序、圖表與表格列都直接讀取，不需重複計算
+interface EnrichedRecord extends ExperimentRecord {
+  anodeDelta: number;
+  cathodeDelta: number;
+  dateMs: number; // 實驗日期的 epoch 毫秒，供時間排序直接比較
+  searchText: string; // 編號/電解液/備註預先轉小寫合併，供搜尋過濾直接比對
+}
+
 type SortKey = keyof ExperimentRecord | "anodeDelta" | "cathodeDelta";
 type SortDirection = "asc" | "desc";
 
@@ -48,6 +57,56 @@ interface Chemical {
   purity?: number;  // 0-1, for liquid
 }
 
+// AI 請求的邊界設定：限制回應長度與等待時間，失敗時以退避方式重試，
+// 避免單次查詢卡住整個介面或產生過長的回應
+const AI_TIMEOUT_MS = 20000;
+const AI_MAX_OUTPUT_TOKENS = 512;
+const AI_QUERY_MAX_CHARS = 120; // 帶入 prompt 的化合物名稱長度上限，避免貼上長文造成 token 浪費
+
+// 從 AI 回應抽出第一個數字 (例如 "58.44 g/mol" → 58.44)
+const MW_NUMBER_RE = /(\d+(\.\d+)?)/;
+const AI_MAX_ATTEMPTS = 3;
+const AI_RETRY_BASE_DELAY_MS = 500;
+
+// 共用的 AI client：只在第一次使用時建立，之後重複使用同一個連線實例，
+// 避免每次搜尋都重新初始化 SDK 與底層連線
+let aiClient: GoogleGenAI | null = null;
+
+const getAiClient = async () => {
+  if (!aiClient) {
+    // 動態載入 SDK：首次使用 AI 搜尋時才下載並初始化，縮短頁面初始載入時間
+    const { GoogleGenAI } = await import("@google/genai");
+    aiClient = new GoogleGenAI({
+      apiKey: process.env.API_KEY,
+      httpOptions: { timeout: AI_TIMEOUT_MS },
+    });
+  }
+  return aiClient;
+};
+
+// 包一層有限次數的重試：逾時或暫時性錯誤時等待後重送，最多 AI_MAX_ATTEMPTS 次
+const generateWithRetry = async (
+  request: Parameters<GoogleGenAI["models"]["generateContent"]>[0]
+) => {
+  let lastError: unknown;
+  for (let attempt = 0; attempt < AI_MAX_ATTEMPTS; attempt++) {
+    if (attempt > 0) {
+      await new Promise((resolve) =>
+        setTimeout(resolve, AI_RETRY_BASE_DELAY_MS * 2 ** (attempt - 1))
+      );
+    }
+    try {
+      const ai = await getAiClient();
+      return await ai.models.generateContent(request);
+    } catch (error) {
+      // 已被中止的請求 (例如被較新的搜尋取代) 直接拋出，不重試
+      if (request.config?.abortSignal?.aborted) throw error;
+      lastError = error;
+    }
+  }
+  throw lastError;
+};
+
 const CHEMICALS: Chemical[] = [
   { name: "K₂CO₃ (碳酸鉀)", formula: "K₂CO₃", mw: 138.21, type: "solid" },
   { name: "Na₂CO₃ (碳酸鈉)", formula: "Na₂CO₃", mw: 105.99, type: "solid" },
@@ -61,6 +120,9 @@ const CHEMICALS: Chemical[] = [
   { name: "H₂SO₄ (濃硫酸 98%)", formula: "H₂SO₄", mw: 98.08, type: "liquid", density: 1.84, purity: 0.98 },
 ];
 
+// 以名稱為鍵的查詢表，模組載入時建立一次；輸入與計算時 O(1) 取得，不必線性掃描 CHEMICALS
+const CHEMICALS_BY_NAME = new Map(CHEMICALS.map((c) => [c.name, c]));
+
 const ReagentCalculator = () => {
   // 使用名稱與 MW 作為 state，允許使用者自訂
   const [chemName, setChemName] = useState(CHEMICALS[0].name);
@@ -72,6 +134,8 @@ const ReagentCalculator = () => {
   // AI 搜尋狀態
   const [isSearching, setIsSearching] = useState(false);
   const [sources, setSources] = useState<{uri: string, title: string}[]>([]);
+  // 追蹤進行中的搜尋：新的搜尋會中止前一個，過期的回應不再寫入狀態
+  const searchAbortRef = useRef<AbortController | null>(null);
 
   // 當使用者輸入或選擇名稱時
   const handleNameChange = (e: React.ChangeEvent<HTMLInputElement>) => {
@@ -81,7 +145,7 @@ const ReagentCalculator = () => {
     setSources([]); // 清除舊的來源
 
     // 嘗試從預設清單中尋找是否有符合的化合物，若有則自動填入 MW
-    const found = CHEMICALS.find(c => c.name === val);
+    const found = CHEMICALS_BY_NAME.get(val);
     if (found) {
       setMw(found.mw.toString());
     }
@@ -93,23 +157,34 @@ const ReagentCalculator = () => {
       return;
     }
     
+    // 中止前一個還在路上的搜尋，避免兩個回應競爭寫入狀態
+    searchAbortRef.current?.abort();
+    const controller = new AbortController();
+    searchAbortRef.current = controller;
+
     setIsSearching(true);
     setSources([]);
 
+    // 只帶入修剪並截斷後的名稱，限制 prompt 大小
+    const query = chemName.trim().slice(0, AI_QUERY_MAX_CHARS);
+
     try {
-      const ai = new GoogleGenAI({ apiKey: process.env.API_KEY });
-      const response = await ai.models.generateContent({
+      const response = await generateWithRetry({
         model: 'gemini-2.5-flash',
-        contents: `What is the molar mass (molecular weight) of ${chemName}? Please provide only the numeric value in g/mol. Do not include any text explanation.`,
+        contents: `What is the molar mass (molecular weight) of ${query}? Please provide only the numeric value in g/mol. Do not include any text explanation.`,
         config: {
           tools: [{ googleSearch: {} }],
+          maxOutputTokens: AI_MAX_OUTPUT_TOKENS,
+          abortSignal: controller.signal,
         },
       });
 
+      // 已被較新的搜尋取代，這份回應作廢
+      if (controller.signal.aborted) return;
+
       const text = response.text;
       if (text) {
-        // Simple heuristic: extract the first number found (e.g., 58.44 from "58.44 g/mol")
-        const match = text.match(/(\d+(\.\d+)?)/);
+        const match = text.match(MW_NUMBER_RE);
         if (match) {
           setMw(match[0]);
           setResult(null); // Reset calculation
@@ -129,10 +204,16 @@ const ReagentCalculator = () => {
       }
 
     } catch (error) {
-      console.error("AI Search Error", error);
-      alert("自動搜尋失敗，請檢查網路連線或稍後再試。");
+      // 被中止的請求不是錯誤，不需要提示使用者
+      if (!controller.signal.aborted) {
+        console.error("AI Search Error", error);
+        alert("自動搜尋失敗，請檢查網路連線或稍後再試。");
+      }
     } finally {
-      setIsSearching(false);
+      // 只有仍是最新一次的搜尋才負責關閉 loading 狀態
+      if (searchAbortRef.current === controller) {
+        setIsSearching(false);
+      }
     }
   };
 
@@ -149,7 +230,7 @@ const ReagentCalculator = () => {
 
     // 判斷是否為預設清單中的特殊液體 (濃硫酸)
     // 只有名稱完全匹配清單中的濃硫酸時，才啟用液體計算邏輯
-    const presetChem = CHEMICALS.find(c => c.name === chemName);
+    const presetChem = CHEMICALS_BY_NAME.get(chemName);
     const isLiquidPreset = presetChem?.type === 'liquid';
 
     const liters = v / 1000;
@@ -331,7 +412,35 @@ const ReagentCalculator = () => {
 };
 
 // ----------------------
-// 3. 主應用程式元件
+// 3. 質量變化趨勢圖元件
+// ----------------------
+
+interface TrendPoint {
+  name: string;
+  anode: number;
+  cathode: number;
+}
+
+// 以 React.memo 包住圖表：chartData 沒變時 (例如只是輸入表單欄位)，
+// 不重新渲染整個 recharts 子樹
+const TrendChart = React.memo(({ data }: { data: TrendPoint[] }) => (
+  <div className="chart-container">
+    <ResponsiveContainer width="100%" height="100%">
+      <LineChart data={data} margin={{ top: 5, right: 30, left: 20, bottom: 5 }}>
+        <CartesianGrid strokeDasharray="3 3" />
+        <XAxis dataKey="name" />
+        <YAxis label={{ value: 'g', angle: -90, position: 'insideLeft' }} />
+        <Tooltip />
+        <Legend />
+        <Line type="monotone" dataKey="anode" name="陽極變化 (Anode)" stroke="#dc2626" activeDot={{ r: 8 }} />
+        <Line type="monotone" dataKey="cathode" name="陰極變化 (Cathode)" stroke="#16a34a" />
+      </LineChart>
+    </ResponsiveContainer>
+  </div>
+));
+
+// ----------------------
+// 4. 主應用程式元件
 // ----------------------
 
 const App = () => {
@@ -377,8 +486,24 @@ const App = () => {
   }, []);
 
   // 2. 當 records 變動時，寫入 localStorage
+  // 掛載當下 records 必為空陣列，跳過這次多餘的寫入，
+  // 也避免在讀取完成前把已儲存的資料暫時蓋成 []
+  const skipInitialPersist = useRef(true);
   useEffect(() => {
-    localStorage.setItem("carbon_experiment_data", JSON.stringify(records));
+    if (skipInitialPersist.current) {
+      skipInitialPersist.current = false;
+      return;
+    }
+    // 批次寫入：短時間內的連續變動 (如批次刪除) 只序列化與寫入一次；
+    // 關閉分頁時以 pagehide 立即寫入，避免漏存
+    const persist = () =>
+      localStorage.setItem("carbon_experiment_data", JSON.stringify(records));
+    const timer = setTimeout(persist, 300);
+    window.addEventListener("pagehide", persist);
+    return () => {
+      clearTimeout(timer);
+      window.removeEventListener("pagehide", persist);
+    };
   }, [records]);
 
   // --- 輔助函式 ---
@@ -413,12 +538,14 @@ const App = () => {
     }
 
     setErrors((prev) => {
-      const newErrors = { ...prev };
+      // 錯誤狀態沒變就沿用原物件，避免每次按鍵都複製一份並觸發重繪
       if (error) {
-        newErrors[name] = error;
-      } else {
-        delete newErrors[name];
+        if (prev[name] === error) return prev;
+        return { ...prev, [name]: error };
       }
+      if (!(name in prev)) return prev;
+      const newErrors = { ...prev };
+      delete newErrors[name];
       return newErrors;
     });
   };
@@ -436,64 +563,80 @@ const App = () => {
 
   // --- 排序與過濾邏輯 (使用 useMemo) ---
 
-  const processedRecords = useMemo(() => {
-    let data = [...records];
-
-    // 1. 搜尋過濾
-    if (searchQuery) {
-      const q = searchQuery.toLowerCase();
-      data = data.filter(
-        (r) =>
-          r.experimentId.toLowerCase().includes(q) ||
-          r.electrolyte.toLowerCase().includes(q) ||
-          r.notes.toLowerCase().includes(q)
-      );
-    }
+  // 先一次算好每筆紀錄的 Δm，後續排序/圖表/表格共用，不再逐處重算
+  const enrichedRecords = useMemo<EnrichedRecord[]>(
+    () =>
+      records.map((r) => ({
+        ...r,
+        anodeDelta: calculateDelta(r.anodeInitial, r.anodeFinal),
+        cathodeDelta: calculateDelta(r.cathodeInitial, r.cathodeFinal),
+        dateMs: new Date(r.date).getTime(),
+        searchText: `${r.experimentId}\n${r.electrolyte}\n${r.notes}`.toLowerCase(),
+      })),
+    [records]
+  );
+
+  // 1. 排序：獨立快取排序結果，搜尋時只需過濾、不必重新排序
+  // (過濾不改變相對順序，先排序再過濾與先過濾再排序結果相同)
+  const sortedRecords = useMemo(() => {
+    // 排序 (decorate-sort) 會產生新陣列，不會動到原本的 enrichedRecords，
+    // 因此不需要先複製一份
+    let data = enrichedRecords;
 
-    // 2. 排序
+    // 先替每筆紀錄算一次排序鍵 (數值與小寫字串)，
+    // 比較函式只讀取預先算好的鍵，避免 O(N log N) 次重複 parseFloat/toLowerCase
     if (sortConfig) {
-      data.sort((a, b) => {
-        let valA: any = a[sortConfig.key as keyof ExperimentRecord];
-        let valB: any = b[sortConfig.key as keyof ExperimentRecord];
-
-        // 處理特殊計算欄位
-        if (sortConfig.key === "anodeDelta") {
-          valA = calculateDelta(a.anodeInitial, a.anodeFinal) || -9999;
-          valB = calculateDelta(b.anodeInitial, b.anodeFinal) || -9999;
-        } else if (sortConfig.key === "cathodeDelta") {
-          valA = calculateDelta(a.cathodeInitial, a.cathodeFinal) || -9999;
-          valB = calculateDelta(b.cathodeInitial, b.cathodeFinal) || -9999;
-        } else {
-           // 字串比較時轉小寫，數字則轉浮點數
-           const numA = parseFloat(valA);
-           const numB = parseFloat(valB);
-           if (!isNaN(numA) && !isNaN(numB)) {
-             valA = numA;
-             valB = numB;
-           } else {
-             valA = String(valA).toLowerCase();
-             valB = String(valB).toLowerCase();
-           }
+      const { key, direction } = sortConfig;
+      const keyed = data.map((r) => {
+        // 處理特殊計算欄位 (已於 enrichedRecords 預先算好)
+        if (key === "anodeDelta") {
+          return { r, num: r.anodeDelta || -9999, str: "" };
+        }
+        if (key === "cathodeDelta") {
+          return { r, num: r.cathodeDelta || -9999, str: "" };
         }
+        const raw = r[key as keyof ExperimentRecord];
+        const num = parseFloat(raw as string);
+        return { r, num: isNaN(num) ? null : num, str: String(raw).toLowerCase() };
+      });
 
-        if (valA < valB) return sortConfig.direction === "asc" ? -1 : 1;
-        if (valA > valB) return sortConfig.direction === "asc" ? 1 : -1;
+      keyed.sort((a, b) => {
+        // 兩邊都是數字時比數值，否則比小寫字串
+        let valA: any, valB: any;
+        if (a.num !== null && b.num !== null) {
+          valA = a.num;
+          valB = b.num;
+        } else {
+          valA = a.str;
+          valB = b.str;
+        }
+        if (valA < valB) return direction === "asc" ? -1 : 1;
+        if (valA > valB) return direction === "asc" ? 1 : -1;
         return 0;
       });
+
+      data = keyed.map((k) => k.r);
     }
 
     return data;
-  }, [records, searchQuery, sortConfig]);
+  }, [enrichedRecords, sortConfig]);
+
+  // 2. 搜尋過濾 (searchText 已預先轉小寫，每筆只需一次 includes)
+  const processedRecords = useMemo(() => {
+    if (!searchQuery) return sortedRecords;
+    const q = searchQuery.toLowerCase();
+    return sortedRecords.filter((r) => r.searchText.includes(q));
+  }, [sortedRecords, searchQuery]);
 
   // 準備圖表資料 (根據篩選後的結果，但依時間排序)
   const chartData = useMemo(() => {
-    // 複製並依時間排序，確保圖表趨勢正確
-    const sortedForChart = [...processedRecords].sort((a,b) => new Date(a.date).getTime() - new Date(b.date).getTime());
+    // 複製並依時間排序，確保圖表趨勢正確 (dateMs 已預先算好，不必逐次建 Date)
+    const sortedForChart = [...processedRecords].sort((a, b) => a.dateMs - b.dateMs);
     
     return sortedForChart.map(r => ({
       name: r.experimentId,
-      anode: calculateDelta(r.anodeInitial, r.anodeFinal) || 0,
-      cathode: calculateDelta(r.cathodeInitial, r.cathodeFinal) || 0,
+      anode: r.anodeDelta || 0,
+      cathode: r.cathodeDelta || 0,
     }));
   }, [processedRecords]);
 
@@ -617,11 +760,11 @@ const App = () => {
     }
   };
 
-  // 匯出功能 (支援全部或選取)
+  // 匯出功能 (支援全部或選取)：直接使用 enrichedRecords，Δm 不必再逐列重算
   const handleExportCSV = (onlySelected = false) => {
-    const targets = onlySelected 
-      ? records.filter(r => selectedIds.has(r.id))
-      : records;
+    const targets = onlySelected
+      ? enrichedRecords.filter(r => selectedIds.has(r.id))
+      : enrichedRecords;
 
     if (targets.length === 0) {
       alert("沒有資料可匯出");
@@ -644,11 +787,12 @@ const App = () => {
       "備註",
     ];
 
-    const csvContent = targets.map((r) => {
-      const anodeDelta = formatDelta(calculateDelta(r.anodeInitial, r.anodeFinal));
-      const cathodeDelta = formatDelta(calculateDelta(r.cathodeInitial, r.cathodeFinal));
+    // 每列各自成為 Blob 的一個片段，避免先把整份 CSV 串接成單一大字串
+    const csvRows = targets.map((r) => {
+      const anodeDelta = formatDelta(r.anodeDelta);
+      const cathodeDelta = formatDelta(r.cathodeDelta);
 
-      return [
+      return "\n" + [
         r.date,
         `"${r.experimentId}"`,
         r.mode,
@@ -665,8 +809,9 @@ const App = () => {
       ].join(",");
     });
 
-    const csvString = "\ufeff" + [headers.join(","), ...csvContent].join("\n");
-    const blob = new Blob([csvString], { type: "text/csv;charset=utf-8;" });
+    const blob = new Blob(["\ufeff" + headers.join(","), ...csvRows], {
+      type: "text/csv;charset=utf-8;",
+    });
     const url = URL.createObjectURL(blob);
     const link = document.createElement("a");
     link.href = url;
@@ -864,19 +1009,7 @@ const App = () => {
       {records.length > 0 && (
         <div className="card">
           <h3 style={{marginTop: 0, marginBottom: '20px'}}>質量變化趨勢圖 (Δm)</h3>
-          <div className="chart-container">
-            <ResponsiveContainer width="100%" height="100%">
-              <LineChart data={chartData} margin={{ top: 5, right: 30, left: 20, bottom: 5 }}>
-                <CartesianGrid strokeDasharray="3 3" />
-                <XAxis dataKey="name" />
-                <YAxis label={{ value: 'g', angle: -90, position: 'insideLeft' }} />
-                <Tooltip />
-                <Legend />
-                <Line type="monotone" dataKey="anode" name="陽極變化 (Anode)" stroke="#dc2626" activeDot={{ r: 8 }} />
-                <Line type="monotone" dataKey="cathode" name="陰極變化 (Cathode)" stroke="#16a34a" />
-              </LineChart>
-            </ResponsiveContainer>
-          </div>
+          <TrendChart data={chartData} />
         </div>
       )}
 
@@ -946,8 +1079,8 @@ const App = () => {
               </tr>
             ) : (
               processedRecords.map((rec) => {
-                const anodeVal = calculateDelta(rec.anodeInitial, rec.anodeFinal);
-                const cathodeVal = calculateDelta(rec.cathodeInitial, rec.cathodeFinal);
+                const anodeVal = rec.anodeDelta;
+                const cathodeVal = rec.cathodeDelta;
                 const anodeDelta = formatDelta(anodeVal);
                 const cathodeDelta = formatDelta(cathodeVal);
                 const isSelected = selectedIds.has(rec.id);